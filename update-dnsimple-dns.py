@@ -5,75 +5,100 @@ Sets HOSTNAMES to point to the local ethernet IP
 Supports single hostname or multiple hostnames (comma-separated)
 """
 
+import functools
+import hashlib
+import importlib.util
 import json
 import os
+import re
 import subprocess
 import sys
+import time
 import logging
-from dotenv import load_dotenv
+from collections import defaultdict, namedtuple
 import socket
-from dnsimple import Client
-from dnsimple.struct import ZoneRecordInput, ZoneRecordUpdateInput
-
-# Load environment variables from .env file
-load_dotenv()
 
 # Configuration from environment variables
-DNSIMPLE_TOKEN = os.getenv("DNSIMPLE_TOKEN")
-DNSIMPLE_ACCOUNT_ID = os.getenv("DNSIMPLE_ACCOUNT_ID")
-DNSIMPLE_SANDBOX = os.getenv("DNSIMPLE_SANDBOX", "false").lower() == "true"
-HOSTNAMES = os.getenv("HOSTNAMES")
-USE_LOCAL_IP = os.getenv("USE_LOCAL_IP", "false").lower() == "true"
+Config = namedtuple('Config', ['token', 'account_id', 'sandbox', 'hostnames', 'use_local_ip'])
+
+@functools.lru_cache(maxsize=1)
+def _config():
+    """Load configuration from the .env file and environment variables, once per process"""
+    from dotenv import load_dotenv
+    
+    # Load environment variables from .env file
+    load_dotenv()
+    
+    return Config(
+        token=os.getenv("DNSIMPLE_TOKEN"),
+        account_id=os.getenv("DNSIMPLE_ACCOUNT_ID"),
+        sandbox=os.getenv("DNSIMPLE_SANDBOX", "false").lower() == "true",
+        hostnames=os.getenv("HOSTNAMES"),
+        use_local_ip=os.getenv("USE_LOCAL_IP", "false").lower() == "true",
+    )
 
 # Logging setup
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Hostname: optional leading wildcard, then at least domain.tld. Each label is
+# 1-63 alphanumerics/hyphens and must start and end with an alphanumeric.
+_HOSTNAME_RE = re.compile(
+    r'(\*\.)?([a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?'
+)
+
+# Loopback, link-local and unspecified addresses are never published
+_SKIP_PREFIXES = ('127.', '169.254.', '0.')
+
+# IPv4 address in `ip -o addr show` output (one line per address)
+_IP_ADDR_RE = re.compile(r'\binet (\d{1,3}(?:\.\d{1,3}){3})/')
+
+# Linux ioctl request to read an interface's IPv4 address
+SIOCGIFADDR = 0x8915
+
+# Last IP successfully pushed for each hostname, persisted between runs
+STATE_FILE = os.path.expanduser("~/.dnsimple_state.json")
+STATE_MAX_AGE = 3600  # seconds before an unchanged hostname is re-checked against DNSimple
+
+# Use the aiohttp client (if installed) once this many hostnames need checking
+ASYNC_MIN_HOSTNAMES = 32
+ASYNC_MAX_CONNECTIONS = 32
+
+# DNSimple REST API endpoints used by the aiohttp client
+DNSIMPLE_API_URL = "https://api.dnsimple.com/v2"
+DNSIMPLE_SANDBOX_API_URL = "https://api.sandbox.dnsimple.com/v2"
+
+# Records fetched per page when listing a zone (DNSimple maximum)
+RECORDS_PER_PAGE = 100
+
+# Zone record methods resolved once per client (method names vary across SDK versions)
+ZoneAPI = namedtuple('ZoneAPI', ['list_records', 'create_record', 'update_record', 'delete_record'])
+
+# Existing A record, independent of whether it came from the SDK or the REST API
+ARecord = namedtuple('ARecord', ['id', 'content'])
+
 def parse_hostnames():
     """Parse hostnames from HOSTNAMES environment variable"""
-    if HOSTNAMES:
+    cfg = _config()
+    if cfg.hostnames:
         # Parse comma-separated list of hostnames
-        hostnames = [hostname.strip() for hostname in HOSTNAMES.split(',') if hostname.strip()]
-        logger.info(f"Using HOSTNAMES configuration: {hostnames}")
+        hostnames = [hostname.strip() for hostname in cfg.hostnames.split(',') if hostname.strip()]
+        logger.info("Using HOSTNAMES configuration: %s", hostnames)
         return hostnames
     else:
         logger.error("No hostnames configured. Please set HOSTNAMES in your .env file.")
         return []
 
-def validate_hostname(hostname):
-    """Enhanced hostname validation with security checks, including wildcard support"""
-    if not hostname or len(hostname) > 253:
-        return False
-    
-    # Check for suspicious patterns
-    if hostname.startswith('.') or hostname.endswith('.') or '..' in hostname:
-        return False
-    
-    # Split into parts
-    parts = hostname.split('.')
-    if len(parts) < 2:  # Require at least domain.tld
-        return False
-    
-    # Validate each part
-    for i, part in enumerate(parts):
-        if not part or len(part) > 63:
-            return False
-        
-        # Special handling for wildcard (*) - only allowed as first part
-        if part == '*':
-            if i != 0:  # Wildcard only allowed at the beginning
-                return False
-            continue
-        
-        # Regular hostname part validation
-        # Must start and end with alphanumeric
-        if not part[0].isalnum() or not part[-1].isalnum():
-            return False
-        # Only allow alphanumeric and hyphens
-        if not all(c.isalnum() or c == '-' for c in part):
-            return False
+def parse_hostname(hostname):
+    """Validate a hostname (with security checks and wildcard support) and split it
+    into (record_name, zone_name), using the last two parts as the zone.
+    Returns None if the hostname is invalid."""
+    if not hostname or len(hostname) > 253 or _HOSTNAME_RE.fullmatch(hostname) is None:
+        return None
     
-    return True
+    head, _, tld = hostname.rpartition('.')
+    record_name, _, domain = head.rpartition('.')
+    return record_name, f"{domain}.{tld}"
 
 def get_local_network_ip():
     """Get the local network IP address (e.g., 192.168.x.x)."""
@@ -85,26 +110,24 @@ def get_local_network_ip():
     logger.error("No local network IP address found on any platform")
     return None
 
+def iter_global_ips_linux():
+    """Yield global-scope IPv4 addresses on Linux using a single ip command."""
+    result = subprocess.run(['ip', '-o', '-4', 'addr', 'show', 'scope', 'global'],
+                            capture_output=True, text=True, check=True)
+    for match in _IP_ADDR_RE.finditer(result.stdout):
+        yield match.group(1)
+
 def get_local_ip_linux():
     """Get local network IP address on Linux."""
     try:
-        # Get all network interfaces with their IPs
-        result = subprocess.run(['ip', 'addr', 'show'], capture_output=True, text=True, check=True)
-        lines = result.stdout.split('\n')
-
         # Look for local network IPs (typically 192.168.x.x or 10.x.x.x)
-        for line in lines:
-            line = line.strip()
-            if line.startswith('inet ') and 'scope global' in line:
-                parts = line.split()
-                if len(parts) >= 2:
-                    ip = parts[1].split('/')[0]  # Remove CIDR notation
-                    # Prefer private IP ranges: 192.168.x.x, 10.x.x.x, 172.16-31.x.x
-                    if (ip.startswith('192.168.') or
-                        ip.startswith('10.') or
-                        (ip.startswith('172.') and 16 <= int(ip.split('.')[1]) <= 31)):
-                        logger.info(f"Found local network IP: {ip}")
-                        return ip
+        for ip in iter_global_ips_linux():
+            # Prefer private IP ranges: 192.168.x.x, 10.x.x.x, 172.16-31.x.x
+            if (ip.startswith('192.168.') or
+                ip.startswith('10.') or
+                (ip.startswith('172.') and 16 <= int(ip.split('.')[1]) <= 31)):
+                logger.info("Found local network IP: %s", ip)
+                return ip
 
         return None
 
@@ -112,25 +135,25 @@ def get_local_ip_linux():
         logger.debug("ip command not available or failed")
         return None
     except Exception as e:
-        logger.debug(f"Error getting local IP on Linux: {e}")
+        logger.debug("Error getting local IP on Linux: %s", e)
         return None
 
 def get_local_ip_macos():
     """Get local network IP address on macOS."""
     try:
         result = subprocess.run(['ifconfig'], capture_output=True, text=True, check=True)
-        lines = result.stdout.split('\n')
 
         current_interface = None
-        for line in lines:
-            line = line.strip()
-
-            # New interface block
-            if line and not line.startswith(' '):
+        for line in result.stdout.splitlines():
+            # New interface block (header lines are not indented)
+            if line and not line[0].isspace():
                 current_interface = line.split(':')[0]
+                continue
+
+            line = line.strip()
 
             # Look for inet address
-            elif line.startswith('inet ') and current_interface:
+            if line.startswith('inet ') and current_interface:
                 parts = line.split()
                 if len(parts) >= 2:
                     ip = parts[1]
@@ -138,7 +161,7 @@ def get_local_ip_macos():
                     if (ip.startswith('192.168.') or
                         ip.startswith('10.') or
                         (ip.startswith('172.') and 16 <= int(ip.split('.')[1]) <= 31)):
-                        logger.info(f"Found local network IP: {ip} on interface {current_interface}")
+                        logger.info("Found local network IP: %s on interface %s", ip, current_interface)
                         return ip
 
         return None
@@ -147,12 +170,18 @@ def get_local_ip_macos():
         logger.debug("ifconfig command not available or failed")
         return None
     except Exception as e:
-        logger.debug(f"Error getting local IP on macOS: {e}")
+        logger.debug("Error getting local IP on macOS: %s", e)
         return None
 
 def get_ethernet_ip():
     """Get the IP address of the ethernet interface."""
-    # Try platform-specific methods
+    # Ask the kernel which source address it would use for an outbound route.
+    # Connecting a UDP socket sends no packets, so this is cheap and offline-safe.
+    ip = get_ip_socket()
+    if ip:
+        return ip
+
+    # Fall back to platform-specific methods
     ip = get_ip_linux() or get_ip_macos()
     if ip:
         return ip
@@ -160,36 +189,72 @@ def get_ethernet_ip():
     logger.error("No ethernet IP address found on any platform")
     return None
 
-def get_ip_linux():
-    """Get IP address on Linux using ip command."""
+def get_ip_socket():
+    """Get the outbound IP address using a connected UDP socket."""
     try:
-        # Try using ip command (modern Linux)
-        result = subprocess.run(['ip', 'route', 'get', '8.8.8.8'], capture_output=True, text=True, check=True)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect(("8.8.8.8", 80))
+            ip = s.getsockname()[0]
+        if ip and not ip.startswith(_SKIP_PREFIXES):
+            logger.info("Found IP using socket: %s", ip)
+            return ip
+        return None
+    except OSError as e:
+        logger.debug("Socket IP detection failed: %s", e)
+        return None
+
+def get_default_route_interface():
+    """Get the interface of the IPv4 default route from /proc/net/route"""
+    best_iface, best_metric = None, None
+    with open('/proc/net/route') as f:
+        next(f, None)  # Skip header
+        for line in f:
+            fields = line.split()
+            # Iface Destination Gateway Flags RefCnt Use Metric Mask ...
+            if len(fields) < 8 or fields[1] != '00000000' or fields[7] != '00000000':
+                continue
+            if not int(fields[3], 16) & 0x1:  # RTF_UP
+                continue
+            metric = int(fields[6])
+            if best_metric is None or metric < best_metric:
+                best_iface, best_metric = fields[0], metric
+    return best_iface
+
+def get_ip_linux_proc():
+    """Get IP address on Linux from the default route interface, without subprocesses"""
+    try:
+        # fcntl is POSIX-only; import here so the rest of the script still loads without it
+        import fcntl
+        import struct
         
-        # Parse output to find source IP
-        for line in result.stdout.split('\n'):
-            if 'src' in line:
-                parts = line.split()
-                src_index = parts.index('src')
-                if src_index + 1 < len(parts):
-                    ip = parts[src_index + 1]
-                    if not ip.startswith('127.') and not ip.startswith('169.254.'):
-                        logger.info(f"Found IP using ip command: {ip}")
-                        return ip
+        iface = get_default_route_interface()
+        if not iface:
+            return None
         
-        # Fallback: try ip addr show
-        result = subprocess.run(['ip', 'addr', 'show'], capture_output=True, text=True, check=True)
-        lines = result.stdout.split('\n')
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            ifreq = fcntl.ioctl(s.fileno(), SIOCGIFADDR, struct.pack('256s', iface[:15].encode()))
+        ip = socket.inet_ntoa(ifreq[20:24])
+        if not ip.startswith(_SKIP_PREFIXES):
+            logger.info("Found IP on default route interface %s: %s", iface, ip)
+            return ip
+        return None
         
-        for line in lines:
-            line = line.strip()
-            if line.startswith('inet ') and 'scope global' in line:
-                parts = line.split()
-                if len(parts) >= 2:
-                    ip = parts[1].split('/')[0]  # Remove CIDR notation
-                    if not ip.startswith('127.') and not ip.startswith('169.254.'):
-                        logger.info(f"Found IP using ip addr: {ip}")
-                        return ip
+    except (ImportError, OSError, ValueError) as e:
+        logger.debug("Could not read default route interface IP: %s", e)
+        return None
+
+def get_ip_linux():
+    """Get IP address on Linux, falling back to the ip command."""
+    ip = get_ip_linux_proc()
+    if ip:
+        return ip
+    
+    try:
+        # Fallback: try ip addr show (modern Linux)
+        for ip in iter_global_ips_linux():
+            if not ip.startswith(_SKIP_PREFIXES):
+                logger.info("Found IP using ip addr: %s", ip)
+                return ip
         
         return None
         
@@ -197,7 +262,7 @@ def get_ip_linux():
         logger.debug("ip command not available or failed")
         return None
     except Exception as e:
-        logger.debug(f"Error getting IP on Linux: {e}")
+        logger.debug("Error getting IP on Linux: %s", e)
         return None
 
 def get_ip_macos():
@@ -205,17 +270,16 @@ def get_ip_macos():
     try:
         # Get network interface info on macOS
         result = subprocess.run(['ifconfig'], capture_output=True, text=True, check=True)
-        lines = result.stdout.split('\n')
         
         # Look for ethernet interface (en0 typically)
         current_interface = None
-        for line in lines:
+        for line in result.stdout.splitlines():
             line = line.strip()
             
             # New interface block
             if line.startswith('en'):
                 current_interface = line.split(':')[0]
-                logger.debug(f"Found interface: {current_interface}")
+                logger.debug("Found interface: %s", current_interface)
             
             # Look for inet address in ethernet interface
             elif line.startswith('inet ') and current_interface and current_interface.startswith('en'):
@@ -224,8 +288,8 @@ def get_ip_macos():
                 if len(parts) >= 2:
                     ip = parts[1]
                     # Skip loopback and link-local addresses
-                    if not ip.startswith('127.') and not ip.startswith('169.254.'):
-                        logger.info(f"Found ethernet IP: {ip} on interface {current_interface}")
+                    if not ip.startswith(_SKIP_PREFIXES):
+                        logger.info("Found ethernet IP: %s on interface %s", ip, current_interface)
                         return ip
         
         return None
@@ -234,207 +298,400 @@ def get_ip_macos():
         logger.debug("ifconfig command not available or failed")
         return None
     except Exception as e:
-        logger.debug(f"Error getting IP on macOS: {e}")
+        logger.debug("Error getting IP on macOS: %s", e)
         return None
 
+def load_state():
+    """Load the {state key: {"ip", "updated_at"}} map of last successfully pushed IPs"""
+    try:
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+        if not isinstance(state, dict):
+            return {}
+        return {key: entry for key, entry in state.items() if isinstance(entry, dict)}
+    except (OSError, ValueError):
+        return {}
+
+def save_state(state):
+    """Persist the {state key: {"ip", "updated_at"}} map of last successfully pushed IPs"""
+    try:
+        with open(STATE_FILE, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+    except OSError as e:
+        logger.warning("Could not write state file %s: %s", STATE_FILE, e)
+
+def state_key(hostname):
+    """Key a hostname's state by DNSimple environment and account, so switching either re-checks it.
+    Without a configured account ID, the token stands in for the account (only a hash is stored)."""
+    cfg = _config()
+    environment = 'sandbox' if cfg.sandbox else 'production'
+    account = cfg.account_id or 'token-' + hashlib.sha256((cfg.token or '').encode()).hexdigest()[:16]
+    return f"{environment}:{account}:{hostname}"
+
+def is_state_current(entry, ip, now):
+    """Check whether a state entry records this IP and is recent enough to skip the API"""
+    if not entry or entry.get('ip') != ip:
+        return False
+    updated_at = entry.get('updated_at')
+    return isinstance(updated_at, (int, float)) and 0 <= now - updated_at <= STATE_MAX_AGE
+
+def get_target_ip():
+    """Get the IP address to publish based on configuration"""
+    # Get local IP based on configuration
+    cfg = _config()
+    if cfg.use_local_ip:
+        logger.info("Using local network IP address")
+        ip = get_local_network_ip()
+        if not ip:
+            logger.error("Could not determine local network IP address")
+            return None
+    else:
+        logger.info("Using public-facing IP address")
+        ip = get_ethernet_ip()
+        if not ip:
+            logger.error("Could not determine local IP address")
+            return None
+    
+    return ip
+
 def get_dnsimple_client():
     """Initialize DNSimple client"""
-    if not DNSIMPLE_TOKEN:
+    cfg = _config()
+    if not cfg.token:
         logger.error("DNSimple token not configured")
         return None
     
     try:
-        client = Client(sandbox=DNSIMPLE_SANDBOX, access_token=DNSIMPLE_TOKEN)
+        # Imported lazily: the SDK pulls in requests/urllib3/ssl, which --help and --dry-run don't need
+        from dnsimple import Client
+        
+        client = Client(sandbox=cfg.sandbox, access_token=cfg.token)
         return client
     except Exception as e:
-        logger.error(f"Failed to initialize DNSimple client: {e}")
+        logger.error("Failed to initialize DNSimple client: %s", e)
         return None
 
 def get_account_id(client):
     """Get account ID from DNSimple"""
     try:
-        if DNSIMPLE_ACCOUNT_ID:
-            return DNSIMPLE_ACCOUNT_ID
+        cfg = _config()
+        if cfg.account_id:
+            return cfg.account_id
         
         whoami = client.identity.whoami().data
         account_id = whoami.account.id
-        logger.info(f"Using account ID: {account_id}")
+        logger.info("Using account ID: %s", account_id)
         return account_id
     except Exception as e:
-        logger.error(f"Failed to get account ID: {e}")
+        logger.error("Failed to get account ID: %s", e)
         return None
 
-def get_existing_dns_records(client, account_id, zone_name):
-    """Get existing DNS records from DNSimple for a zone"""
+def resolve_zone_methods(client):
+    """Resolve the zone record methods available on the DNSimple client"""
+    zones = client.zones
+    
+    # Try common method names for listing records
+    if hasattr(zones, 'list_records'):
+        list_records = zones.list_records
+    elif hasattr(zones, 'records'):
+        list_records = zones.records
+    elif hasattr(zones, 'all_records'):
+        list_records = zones.all_records
+    else:
+        # Fall back to direct API call
+        list_records = zones.list_zone_records
+    
+    # Try common method names for creating, updating and deleting records
+    create_record = zones.create_record if hasattr(zones, 'create_record') else zones.create_zone_record
+    update_record = zones.update_record if hasattr(zones, 'update_record') else zones.update_zone_record
+    delete_record = zones.delete_record if hasattr(zones, 'delete_record') else zones.delete_zone_record
+    
+    return ZoneAPI(list_records, create_record, update_record, delete_record)
+
+def get_existing_dns_records(zone_api, account_id, zone_name):
+    """Get existing A records from DNSimple for a zone, following pagination"""
     try:
-        # Try common method names for listing records
-        if hasattr(client.zones, 'list_records'):
-            records = client.zones.list_records(account_id, zone_name).data
-        elif hasattr(client.zones, 'records'):
-            records = client.zones.records(account_id, zone_name).data
-        elif hasattr(client.zones, 'all_records'):
-            records = client.zones.all_records(account_id, zone_name).data
-        else:
-            # Fall back to direct API call
-            records = client.zones.list_zone_records(account_id, zone_name).data
-        return records
+        records = []
+        page = 1
+        while True:
+            data = zone_api.list_records(account_id, zone_name, filter={'type': 'A'},
+                                         page=page, per_page=RECORDS_PER_PAGE).data
+            records.extend(data)
+            # A short page is the last one
+            if len(data) < RECORDS_PER_PAGE:
+                return records
+            page += 1
     except Exception as e:
-        logger.error(f"Failed to get existing DNS records for {zone_name}: {e}")
+        logger.error("Failed to get existing DNS records for %s: %s", zone_name, e)
         return None
 
-def delete_dns_record(client, account_id, zone_name, record_id):
+def delete_dns_record(zone_api, account_id, zone_name, record_id):
     """Delete DNS record from DNSimple"""
     try:
-        # Try common method names for deleting records
-        if hasattr(client.zones, 'delete_record'):
-            client.zones.delete_record(account_id, zone_name, record_id)
-        else:
-            client.zones.delete_zone_record(account_id, zone_name, record_id)
-        logger.info(f"Deleted DNS record {record_id} from zone {zone_name}")
+        zone_api.delete_record(account_id, zone_name, record_id)
+        logger.info("Deleted DNS record %s from zone %s", record_id, zone_name)
         return True
     except Exception as e:
-        logger.error(f"Failed to delete DNS record {record_id}: {e}")
+        logger.error("Failed to delete DNS record %s: %s", record_id, e)
         return False
 
 def validate_ip_address(ip):
-    """Validate IP address format"""
+    """Validate IPv4 address format (A records only)"""
     try:
-        import ipaddress
-        ipaddress.ip_address(ip)
+        socket.inet_pton(socket.AF_INET, ip)
         return True
-    except ValueError:
+    except (OSError, TypeError):
         return False
 
-def create_dns_record(client, account_id, zone_name, name, ip):
+def create_dns_record(zone_api, account_id, zone_name, name, ip):
     """Create DNS A record in DNSimple"""
     try:
-        # Validate IP address
-        if not validate_ip_address(ip):
-            logger.error(f"Invalid IP address format: {ip}")
-            return False
+        from dnsimple.struct import ZoneRecordInput
         
-        # Try common method names for creating records
         record_data = ZoneRecordInput(
             name=name,
             type="A",
             content=ip,
             ttl=300
         )
-        if hasattr(client.zones, 'create_record'):
-            response = client.zones.create_record(account_id, zone_name, record_data)
-        else:
-            response = client.zones.create_zone_record(account_id, zone_name, record_data)
-        logger.info(f"Successfully created DNS record: {name}.{zone_name} -> {ip}")
+        response = zone_api.create_record(account_id, zone_name, record_data)
+        logger.info("Successfully created DNS record: %s.%s -> %s", name, zone_name, ip)
         return response.data
         
     except Exception as e:
-        logger.error(f"Failed to create DNS record: {e}")
+        logger.error("Failed to create DNS record: %s", e)
         return False
 
-def update_dns_record(client, account_id, zone_name, record_id, ip):
+def update_dns_record(zone_api, account_id, zone_name, record_id, ip):
     """Update existing DNS A record in DNSimple"""
     try:
-        # Validate IP address
-        if not validate_ip_address(ip):
-            logger.error(f"Invalid IP address format: {ip}")
-            return False
+        from dnsimple.struct import ZoneRecordUpdateInput
         
-        # Try common method names for updating records
         update_data = ZoneRecordUpdateInput(
             content=ip,
             ttl=300
         )
-        if hasattr(client.zones, 'update_record'):
-            response = client.zones.update_record(account_id, zone_name, record_id, update_data)
-        else:
-            response = client.zones.update_zone_record(account_id, zone_name, record_id, update_data)
-        logger.info(f"Successfully updated DNS record {record_id} -> {ip}")
+        response = zone_api.update_record(account_id, zone_name, record_id, update_data)
+        logger.info("Successfully updated DNS record %s -> %s", record_id, ip)
         return response.data
         
     except Exception as e:
-        logger.error(f"Failed to update DNS record {record_id}: {e}")
+        logger.error("Failed to update DNS record %s: %s", record_id, e)
         return False
 
-def process_hostname(client, account_id, hostname, local_ip):
-    """Process a single hostname for DNS record update"""
-    logger.info(f"Processing hostname: {hostname}")
-    
-    # Validate hostname
-    if not validate_hostname(hostname):
-        logger.error(f"Invalid hostname format: {hostname}")
-        return False
-    
-    # Parse hostname to get zone and record name
-    parts = hostname.split('.')
-    if len(parts) < 2:
-        logger.error(f"Invalid hostname format: {hostname}")
-        return False
-    
-    # Extract zone name (last two parts for basic domains)
-    zone_name = '.'.join(parts[-2:])
-    
-    # Handle record name, including wildcard support
-    if len(parts) > 2:
-        record_name = '.'.join(parts[:-2])
-    else:
-        record_name = ''
+def index_a_records(records):
+    """Index a zone's A records (SDK objects) by record name"""
+    return {record.name: ARecord(record.id, record.content) for record in records if record.type == 'A'}
+
+def plan_record_change(hostname, record_name, zone_name, local_ip, a_records):
+    """Decide how to bring a hostname's A record to local_ip (validated once by the caller).
+    Returns (action, existing_record) where action is 'current', 'update' or 'create'."""
+    logger.info("Processing hostname: %s", hostname)
     
     # Log wildcard record creation
     if record_name == '*':
-        logger.info(f"Creating wildcard record for zone {zone_name}")
+        logger.info("Creating wildcard record for zone %s", zone_name)
     elif record_name.startswith('*.'):
-        logger.info(f"Creating wildcard record: {record_name} for zone {zone_name}")
-    
-    # Get existing records for this zone
-    existing_records = get_existing_dns_records(client, account_id, zone_name)
-    if existing_records is None:
-        logger.error(f"Could not retrieve existing records for zone {zone_name}")
-        return False
+        logger.info("Creating wildcard record: %s for zone %s", record_name, zone_name)
     
     # Check if A record already exists for this hostname
-    existing_record = None
-    for record in existing_records:
-        if record.type == 'A' and record.name == record_name:
-            existing_record = record
-            break
-    
-    if existing_record:
-        if existing_record.content == local_ip:
-            logger.info(f"DNS record already exists and is current: {hostname} -> {local_ip}")
+    existing_record = a_records.get(record_name)
+    
+    if existing_record is None:
+        return 'create', None
+    if existing_record.content == local_ip:
+        logger.info("DNS record already exists and is current: %s -> %s", hostname, local_ip)
+        return 'current', existing_record
+    logger.info("DNS record exists but IP is different: %s -> %s", existing_record.content, local_ip)
+    return 'update', existing_record
+
+def process_hostname(zone_api, account_id, hostname, record_name, zone_name, local_ip, a_records):
+    """Process a single parsed hostname for DNS record update against the zone's indexed A records"""
+    action, existing_record = plan_record_change(hostname, record_name, zone_name, local_ip, a_records)
+    
+    if action == 'current':
+        return True
+    elif action == 'update':
+        # Update existing record
+        if update_dns_record(zone_api, account_id, zone_name, existing_record.id, local_ip):
+            logger.info("Successfully updated DNS record: %s -> %s", hostname, local_ip)
             return True
         else:
-            logger.info(f"DNS record exists but IP is different: {existing_record.content} -> {local_ip}")
-            # Update existing record
-            if update_dns_record(client, account_id, zone_name, existing_record.id, local_ip):
-                logger.info(f"Successfully updated DNS record: {hostname} -> {local_ip}")
-                return True
-            else:
-                logger.error(f"Failed to update DNS record for {hostname}")
-                return False
+            logger.error("Failed to update DNS record for %s", hostname)
+            return False
     else:
         # Create new record
-        if create_dns_record(client, account_id, zone_name, record_name, local_ip):
-            logger.info(f"Successfully created DNS record: {hostname} -> {local_ip}")
+        if create_dns_record(zone_api, account_id, zone_name, record_name, local_ip):
+            logger.info("Successfully created DNS record: %s -> %s", hostname, local_ip)
             return True
         else:
-            logger.error(f"Failed to create DNS record for {hostname}")
+            logger.error("Failed to create DNS record for %s", hostname)
             return False
 
-def update_dns_records():
-    """Main function to update DNS records for all hostnames"""
-    logger.info("Starting DNS records update...")
-    
+def update_zones_sdk(zones, local_ip):
+    """Update (hostname, record name) pairs grouped by zone using the DNSimple client.
+    Returns the hostnames that succeeded, or None if the client could not be set up."""
     # Initialize DNSimple client
     client = get_dnsimple_client()
     if not client:
         logger.error("Could not initialize DNSimple client")
-        return False
+        return None
     
     # Get account ID
     account_id = get_account_id(client)
     if not account_id:
         logger.error("Could not get account ID")
-        return False
+        return None
+    
+    # Resolve zone record methods once for all hostnames
+    zone_api = resolve_zone_methods(client)
+    
+    # Calls run serially on purpose: dnsimple 2.x Response stores .data and .pagination
+    # on the Response class, so concurrent SDK calls can read another call's result.
+    # Concurrency for large hostname sets is left to the aiohttp path.
+    succeeded = []
+    for zone_name, zone_hostnames in zones.items():
+        # Get existing records for this zone
+        existing_records = get_existing_dns_records(zone_api, account_id, zone_name)
+        if existing_records is None:
+            logger.error("Could not retrieve existing records for zone %s", zone_name)
+            for hostname, _ in zone_hostnames:
+                logger.error("Failed to process hostname: %s", hostname)
+            continue
+        a_records = index_a_records(existing_records)
+        
+        for hostname, record_name in zone_hostnames:
+            if process_hostname(zone_api, account_id, hostname, record_name, zone_name, local_ip, a_records):
+                succeeded.append(hostname)
+            else:
+                logger.error("Failed to process hostname: %s", hostname)
+                # Continue processing other hostnames instead of failing completely
+    
+    return succeeded
+
+def aiohttp_available():
+    """Check whether the optional aiohttp package is installed"""
+    return importlib.util.find_spec('aiohttp') is not None
+
+async def _api_request_async(session, method, url, payload=None):
+    """Send a DNSimple REST API request, returning the decoded JSON body (None for 204)"""
+    async with session.request(method, url, json=payload) as response:
+        response.raise_for_status()
+        if response.status == 204:
+            return None
+        return await response.json()
+
+async def get_account_id_async(session, base_url):
+    """Get account ID from DNSimple using the aiohttp client"""
+    try:
+        cfg = _config()
+        if cfg.account_id:
+            return cfg.account_id
+        
+        whoami = (await _api_request_async(session, 'GET', f"{base_url}/whoami"))['data']
+        account_id = (whoami.get('account') or {}).get('id')
+        logger.info("Using account ID: %s", account_id)
+        return account_id
+    except Exception as e:
+        logger.error("Failed to get account ID: %s", e)
+        return None
+
+async def get_existing_a_records_async(session, base_url, account_id, zone_name):
+    """Get existing A records for a zone using the aiohttp client, following pagination"""
+    try:
+        records = []
+        page = 1
+        while True:
+            url = f"{base_url}/{account_id}/zones/{zone_name}/records?type=A&per_page={RECORDS_PER_PAGE}&page={page}"
+            body = await _api_request_async(session, 'GET', url)
+            records.extend(body['data'])
+            if page >= body.get('pagination', {}).get('total_pages', 1):
+                return records
+            page += 1
+    except Exception as e:
+        logger.error("Failed to get existing DNS records for %s: %s", zone_name, e)
+        return None
+
+async def process_hostname_async(session, base_url, account_id, hostname, record_name, zone_name, local_ip, a_records):
+    """Process a single parsed hostname for DNS record update using the aiohttp client"""
+    action, existing_record = plan_record_change(hostname, record_name, zone_name, local_ip, a_records)
+    records_url = f"{base_url}/{account_id}/zones/{zone_name}/records"
+    
+    if action == 'current':
+        return True
+    elif action == 'update':
+        # Update existing record
+        try:
+            await _api_request_async(session, 'PATCH', f"{records_url}/{existing_record.id}",
+                                     {'content': local_ip, 'ttl': 300})
+            logger.info("Successfully updated DNS record: %s -> %s", hostname, local_ip)
+            return True
+        except Exception as e:
+            logger.error("Failed to update DNS record for %s: %s", hostname, e)
+            return False
+    else:
+        # Create new record
+        try:
+            await _api_request_async(session, 'POST', records_url,
+                                     {'name': record_name, 'type': 'A', 'content': local_ip, 'ttl': 300})
+            logger.info("Successfully created DNS record: %s -> %s", hostname, local_ip)
+            return True
+        except Exception as e:
+            logger.error("Failed to create DNS record for %s: %s", hostname, e)
+            return False
+
+async def update_zones_async(zones, local_ip):
+    """Update (hostname, record name) pairs grouped by zone using a single aiohttp session.
+    Returns the hostnames that succeeded, or None if the session could not be set up."""
+    import asyncio
+    import aiohttp
+    
+    cfg = _config()
+    if not cfg.token:
+        logger.error("DNSimple token not configured")
+        return None
+    
+    base_url = DNSIMPLE_SANDBOX_API_URL if cfg.sandbox else DNSIMPLE_API_URL
+    headers = {'Authorization': f"Bearer {cfg.token}", 'Accept': 'application/json'}
+    connector = aiohttp.TCPConnector(limit=ASYNC_MAX_CONNECTIONS, ttl_dns_cache=300)
+    
+    async with aiohttp.ClientSession(headers=headers, connector=connector) as session:
+        account_id = await get_account_id_async(session, base_url)
+        if not account_id:
+            logger.error("Could not get account ID")
+            return None
+        
+        # Get existing records for every zone
+        zone_names = list(zones)
+        zone_records = await asyncio.gather(
+            *(get_existing_a_records_async(session, base_url, account_id, zone_name) for zone_name in zone_names))
+        
+        jobs = []
+        for zone_name, existing_records in zip(zone_names, zone_records):
+            if existing_records is None:
+                logger.error("Could not retrieve existing records for zone %s", zone_name)
+                for hostname, _ in zones[zone_name]:
+                    logger.error("Failed to process hostname: %s", hostname)
+                continue
+            a_records = {record['name']: ARecord(record['id'], record['content'])
+                         for record in existing_records if record['type'] == 'A'}
+            jobs.extend((hostname, record_name, zone_name, a_records) for hostname, record_name in zones[zone_name])
+        
+        results = await asyncio.gather(
+            *(process_hostname_async(session, base_url, account_id, hostname, record_name, zone_name, local_ip, a_records)
+              for hostname, record_name, zone_name, a_records in jobs))
+    
+    succeeded = []
+    for (hostname, *_), success in zip(jobs, results):
+        if success:
+            succeeded.append(hostname)
+        else:
+            logger.error("Failed to process hostname: %s", hostname)
+    return succeeded
+
+def update_dns_records():
+    """Main function to update DNS records for all hostnames"""
+    logger.info("Starting DNS records update...")
     
     # Parse hostnames
     hostnames = parse_hostnames()
@@ -442,63 +699,92 @@ def update_dns_records():
         logger.error("No hostnames configured")
         return False
     
-    logger.info(f"Processing {len(hostnames)} hostname(s): {hostnames}")
+    logger.info("Processing %d hostname(s): %s", len(hostnames), hostnames)
 
-    # Get local IP based on configuration
-    if USE_LOCAL_IP:
-        logger.info("Using local network IP address")
-        local_ip = get_local_network_ip()
-        if not local_ip:
-            logger.error("Could not determine local network IP address")
-            return False
-    else:
-        logger.info("Using public-facing IP address")
-        local_ip = get_ethernet_ip()
-        if not local_ip:
-            logger.error("Could not determine local IP address")
-            return False
+    # Detect the IP on every call; a long-running caller must see address changes
+    local_ip = get_target_ip()
+    if not local_ip:
+        return False
+    
+    # Validate IP address once; it is the same for every hostname
+    if not validate_ip_address(local_ip):
+        logger.error("Invalid IP address format: %s", local_ip)
+        return False
 
-    logger.info(f"Using IP: {local_ip}")
+    logger.info("Using IP: %s", local_ip)
+    
+    # Skip hostnames whose records were recently pushed with this IP to the same account
+    state = load_state()
+    now = time.time()
+    unchanged = []
+    needs_check = []
+    for hostname in hostnames:
+        if is_state_current(state.get(state_key(hostname)), local_ip, now):
+            unchanged.append(hostname)
+        else:
+            needs_check.append(hostname)
+    for hostname in unchanged:
+        logger.info("IP unchanged since last successful update, skipping: %s -> %s", hostname, local_ip)
+    
+    if not needs_check:
+        logger.info("DNS records already current for all %d hostname(s)", len(hostnames))
+        return True
     
     # Process each hostname
-    success_count = 0
+    success_count = len(unchanged)
     total_count = len(hostnames)
     
-    for hostname in hostnames:
-        if process_hostname(client, account_id, hostname, local_ip):
-            success_count += 1
+    # Group (hostname, record name) pairs by zone so records are fetched once per zone
+    zones = defaultdict(list)
+    for hostname in needs_check:
+        parsed = parse_hostname(hostname)
+        if parsed is None:
+            logger.error("Invalid hostname format: %s", hostname)
+            logger.error("Failed to process hostname: %s", hostname)
+            continue
+        record_name, zone_name = parsed
+        zones[zone_name].append((hostname, record_name))
+    
+    if zones:
+        if len(needs_check) >= ASYNC_MIN_HOSTNAMES and aiohttp_available():
+            # Imported here: asyncio adds noticeably to cold start and is only needed on this path
+            import asyncio
+            
+            logger.info("Using aiohttp client for %d hostname(s)", len(needs_check))
+            succeeded = asyncio.run(update_zones_async(zones, local_ip))
         else:
-            logger.error(f"Failed to process hostname: {hostname}")
-            # Continue processing other hostnames instead of failing completely
+            succeeded = update_zones_sdk(zones, local_ip)
+        if succeeded is None:
+            return False
+        
+        success_count += len(succeeded)
+        now = time.time()
+        for hostname in succeeded:
+            state[state_key(hostname)] = {'ip': local_ip, 'updated_at': now}
+        save_state(state)
     
     # Log summary
     if success_count == total_count:
-        logger.info(f"DNS records update completed successfully for all {total_count} hostname(s)")
+        logger.info("DNS records update completed successfully for all %d hostname(s)", total_count)
         return True
     elif success_count > 0:
-        logger.warning(f"DNS records update partially completed: {success_count}/{total_count} hostname(s) succeeded")
+        logger.warning("DNS records update partially completed: %d/%d hostname(s) succeeded", success_count, total_count)
         return True  # Return success if at least one hostname was processed
     else:
         logger.error("DNS records update failed for all hostnames")
         return False
 
-def main():
-    """Main entry point"""
-    if len(sys.argv) > 1 and sys.argv[1] in ['-h', '--help']:
-        hostnames = parse_hostnames()
-        hostname_display = ', '.join(hostnames) if hostnames else '[not configured]'
-        
-        print(f"""
+HELP_TEXT = """
 DNSimple DNS Records Updater
 
 Updates DNSimple DNS records to point hostname(s) to local ethernet IP.
 
 Configuration (edit .env file to change):
-- DNSimple Token: {'[configured]' if DNSIMPLE_TOKEN else '[not configured]'}
-- Account ID: {DNSIMPLE_ACCOUNT_ID or '[auto-detected]'}
-- Sandbox Mode: {'Enabled' if DNSIMPLE_SANDBOX else 'Disabled'}
-- Use Local IP: {'Enabled (192.168.x.x)' if USE_LOCAL_IP else 'Disabled (public IP)'}
-- Hostname(s): {hostname_display}
+- DNSimple Token: {token}
+- Account ID: {account_id}
+- Sandbox Mode: {sandbox}
+- Use Local IP: {use_local_ip}
+- Hostname(s): {hostnames}
 
 Environment Variables:
 - HOSTNAMES: Comma-separated list of hostnames
@@ -510,24 +796,40 @@ Environment Variables:
 - DNSIMPLE_SANDBOX: Set to 'true' to use sandbox environment (default: false)
 - USE_LOCAL_IP: Set to 'true' to use local network IP (e.g., 192.168.x.x) instead of public IP (default: false)
 
-Usage: {sys.argv[0]} [options]
+Usage: {prog} [options]
 Options:
   -h, --help    Show this help message
   --dry-run     Show what would be done without making changes
-        """)
+        """
+
+def main():
+    """Main entry point"""
+    if len(sys.argv) > 1 and sys.argv[1] in ['-h', '--help']:
+        cfg = _config()
+        hostnames = parse_hostnames()
+        hostname_display = ', '.join(hostnames) if hostnames else '[not configured]'
+        
+        print(HELP_TEXT.format(
+            token='[configured]' if cfg.token else '[not configured]',
+            account_id=cfg.account_id or '[auto-detected]',
+            sandbox='Enabled' if cfg.sandbox else 'Disabled',
+            use_local_ip='Enabled (192.168.x.x)' if cfg.use_local_ip else 'Disabled (public IP)',
+            hostnames=hostname_display,
+            prog=sys.argv[0],
+        ))
         return
     
     if len(sys.argv) > 1 and sys.argv[1] == '--dry-run':
         logger.info("DRY RUN MODE - No changes will be made")
         hostnames = parse_hostnames()
-        local_ip = get_local_network_ip() if USE_LOCAL_IP else get_ethernet_ip()
+        local_ip = get_target_ip() if hostnames else None
         if local_ip and hostnames:
-            logger.info(f"Would update {len(hostnames)} hostname(s): {hostnames}")
+            logger.info("Would update %d hostname(s): %s", len(hostnames), hostnames)
             for hostname in hostnames:
-                if validate_hostname(hostname):
-                    logger.info(f"  {hostname} -> {local_ip}")
+                if parse_hostname(hostname):
+                    logger.info("  %s -> %s", hostname, local_ip)
                 else:
-                    logger.error(f"  Invalid hostname format: {hostname}")
+                    logger.error("  Invalid hostname format: %s", hostname)
         elif not hostnames:
             logger.error("No hostnames configured")
         else: